@@ -1,3 +1,9 @@
+import copy
+import pickle
+import sys
+import threading
+import time
+
 from pyutilib.misc.timing import HierarchicalTimer
 import pyutilib.th as unittest
 
@@ -21,6 +27,10 @@ class TestHierarchicalTimer(unittest.TestCase):
             timer.stop('all')
         timer.stop('a')
         timer.stop('all')
+        with self.assertRaisesRegex(
+                ValueError, 'all is not the currently active timer.  '
+                'There are no active timers'):
+            timer.stop('all')
 
         a_percent = timer.get_relative_percent_time('all.a')
         aa_percent = timer.get_relative_percent_time('all.a.aa')
@@ -31,3 +41,99 @@ class TestHierarchicalTimer(unittest.TestCase):
         self.assertAlmostEqual(timer.get_num_calls('all.a.aa'), 50)
         timer.get_total_time('all.b')
         print(timer)
+
+    def test_total_time_units(self):
+        timer = HierarchicalTimer()
+        timer.start('all')
+        time.sleep(0.01)
+        timer.stop('all')
+        # times are reported in seconds
+        self.assertGreaterEqual(timer.get_total_time('all'), 0.01)
+        self.assertLess(timer.get_total_time('all'), 10)
+
+    def test_str_empty(self):
+        timer = HierarchicalTimer()
+        self.assertEqual(
+            str(timer),
+            'Identifier   ncalls   cumtime   percall      %\n'
+            + '-' * 36 + '\n' + '=' * 36 + '\n')
+
+    def test_pickle_and_deepcopy(self):
+        timer = HierarchicalTimer()
+        timer.start('all')
+        timer.start('a')
+        timer.stop('a')
+        timer.stop('all')
+        copies = [pickle.loads(pickle.dumps(timer, protocol))
+                  for protocol in range(pickle.HIGHEST_PROTOCOL + 1)]
+        copies.append(copy.deepcopy(timer))
+        for other in copies:
+            self.assertIsNot(other, timer)
+            self.assertEqual(other.stack, [])
+            self.assertEqual(other.get_num_calls('all.a'), 1)
+            self.assertEqual(other.get_total_time('all'),
+                             timer.get_total_time('all'))
+            self.assertEqual(str(other), str(timer))
+            # The copy is a fully functional timer
+            other.start('all')
+            other.stop('all')
+            self.assertEqual(other.get_num_calls('all'), 2)
+            self.assertEqual(timer.get_num_calls('all'), 1)
+
+    def test_str_without_elapsed_time(self):
+        timer = HierarchicalTimer()
+        timer.start('all')
+        timer.start('a')
+        # Timers that have not accumulated any time (they are still
+        # running) report NaN percents
+        self.assertIn('nan', str(timer))
+        timer.stop('a')
+        timer.stop('all')
+
+    def test_threads(self):
+        timer = HierarchicalTimer()
+        started = []
+        release = threading.Event()
+        errors = []
+
+        def work():
+            try:
+                timer.start('all')
+                timer.start('a')
+                started.append(1)
+                # Hold both timers open until every thread has started
+                release.wait()
+                self.assertEqual(timer.stack, ['all', 'a'])
+                for i in range(50):
+                    timer.start('aa')
+                    timer.stop('aa')
+                timer.stop('a')
+                timer.stop('all')
+            except Exception as e:
+                errors.append(e)
+                started.append(1)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        while len(started) < len(threads):
+            time.sleep(0.001)
+        self.assertEqual(timer.stack, [])
+        # Encourage thread switches inside start() / stop()
+        if hasattr(sys, 'setswitchinterval'):
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+        try:
+            release.set()
+            for t in threads:
+                t.join()
+        finally:
+            if hasattr(sys, 'setswitchinterval'):
+                sys.setswitchinterval(switch_interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(timer.get_num_calls('all'), 4)
+        self.assertEqual(timer.get_num_calls('all.a'), 4)
+        self.assertEqual(timer.get_num_calls('all.a.aa'), 200)
+        # All threads share a single helper per timer
+        self.assertEqual(len(timer.timers), 1)
+        self.assertEqual(len(timer.timers['all']._thread_timers), 4)
@@ -0,0 +1,234 @@
+import copy
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+
+from six import StringIO
+
+from pyutilib.misc import capture_output
+from pyutilib.misc.timing import TicTocTimer, tic, toc, reset_global_timer
+import pyutilib.misc.timing as timing
+import pyutilib.th as unittest
+
+
+class TestTicTocTimer(unittest.TestCase):
+    def test_default_message(self):
+        timer = TicTocTimer(ostream=StringIO())
+        timer.toc()
+        self.assertRegex(
+            timer._ostream.getvalue(),
+            r'^\[\+ *[0-9.]+\] File ".*test_timing.py", line \d+ '
+            r'in test_default_message\n$')
+
+    def test_no_message(self):
+        timer = TicTocTimer(ostream=StringIO())
+        ans = timer.toc('')
+        self.assertGreaterEqual(ans, 0)
+        ans = timer.toc(False, delta=False)
+        self.assertGreaterEqual(ans, 0)
+        self.assertEqual(timer._ostream.getvalue(), '')
+
+    def test_buffered_output(self):
+        timer = TicTocTimer(ostream=StringIO(), buffer_size=3)
+        timer.toc('a')
+        timer.toc('b')
+        self.assertEqual(timer._ostream.getvalue(), '')
+        timer.toc('c')
+        self.assertEqual(len(timer._ostream.getvalue().splitlines()), 3)
+        timer.toc('d')
+        self.assertEqual(len(timer._ostream.getvalue().splitlines()), 3)
+        timer.flush()
+        output = timer._ostream.getvalue().splitlines()
+        self.assertEqual([line[-1] for line in output], ['a', 'b', 'c', 'd'])
+
+        # Switching streams writes out the messages for the old stream
+        other = StringIO()
+        timer.toc('e')
+        timer.toc('f', ostream=other)
+        self.assertEqual(len(timer._ostream.getvalue().splitlines()), 5)
+        self.assertEqual(other.getvalue(), '')
+        timer.flush()
+        self.assertEqual(other.getvalue()[-2:], 'f\n')
+
+    def test_global_timer_per_thread(self):
+        timers = []
+        errors = []
+
+        def work():
+            try:
+                out = StringIO()
+                tic(ostream=out)
+                toc('done', ostream=out)
+                self.assertRegex(
+                    out.getvalue(),
+                    r'^\[ *[0-9.]+\] Resetting the tic/toc delta timer\n'
+                    r'\[\+ *[0-9.]+\] done\n$')
+                timers.append(timing._get_thread_timer())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(timers), 2)
+        self.assertIsNot(timers[0], timers[1])
+        self.assertIsNot(timers[0], timing._globalTimer)
+        self.assertIs(timing._get_thread_timer(), timing._globalTimer)
+
+    def test_global_timer_load_time(self):
+        main_since_load = toc('', delta=False)
+        results = []
+
+        def work():
+            results.append(toc('', delta=False))
+
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+        # Worker threads also report the time since the module was loaded
+        self.assertEqual(len(results), 1)
+        self.assertGreaterEqual(results[0], main_since_load)
+
+    def test_module_toc_default_message(self):
+        out = StringIO()
+        toc(ostream=out)
+        self.assertRegex(
+            out.getvalue(),
+            r'^\[\+ *[0-9.]+\] File ".*test_timing.py", line \d+ '
+            r'in test_module_toc_default_message\n$')
+
+    def test_logger_level(self):
+        logger = logging.getLogger('pyutilib.misc.tests.test_timing')
+        out = StringIO()
+        handler = logging.StreamHandler(out)
+        logger.addHandler(handler)
+        logger.propagate = False
+        caller_info = timing._caller_info
+        calls = []
+
+        def _caller_info():
+            calls.append(1)
+            return ('caller.py', 1, 'caller')
+
+        timing._caller_info = _caller_info
+        try:
+            timer = TicTocTimer()
+            logger.setLevel(logging.WARNING)
+            with capture_output() as stdout:
+                self.assertGreaterEqual(timer.toc(logger=logger), 0)
+            # The filtered message is never generated or printed
+            self.assertEqual(calls, [])
+            self.assertEqual(stdout.getvalue(), '')
+            self.assertEqual(out.getvalue(), '')
+
+            logger.setLevel(logging.INFO)
+            with capture_output() as stdout:
+                timer.toc(logger=logger)
+            self.assertEqual(calls, [1])
+            self.assertEqual(stdout.getvalue(), '')
+            self.assertRegex(
+                out.getvalue(),
+                r'^\[\+ *[0-9.]+\] File "caller.py", line 1 in caller\n$')
+
+            # A logger given to the constructor does not replace the
+            # stdout fallback: the message is still printed (even if the
+            # logger filters it)
+            timer = TicTocTimer(logger=logger)
+            logger.setLevel(logging.WARNING)
+            with capture_output() as stdout:
+                timer.toc('hello')
+            self.assertRegex(stdout.getvalue(), r'^\[\+ *[0-9.]+\] hello\n$')
+            self.assertNotIn('hello', out.getvalue())
+            logger.setLevel(logging.INFO)
+            with capture_output() as stdout:
+                timer.toc('hello')
+            self.assertRegex(stdout.getvalue(), r'^\[\+ *[0-9.]+\] hello\n$')
+            self.assertIn('hello', out.getvalue())
+        finally:
+            timing._caller_info = caller_info
+            logger.removeHandler(handler)
+            logger.propagate = True
+            logger.setLevel(logging.NOTSET)
+
+    def test_start_stop(self):
+        timer = TicTocTimer(ostream=StringIO())
+        timer.start()
+        time.sleep(0.01)
+        timer.start()
+        time.sleep(0.01)
+        ans = timer.toc('running')
+        self.assertGreaterEqual(ans, 0.02)
+        self.assertRegex(
+            timer._ostream.getvalue(), r'^\[ *[0-9.]+\| *2\] running\n$')
+        timer.stop()
+        self.assertGreaterEqual(timer.toc(''), ans)
+        with self.assertRaisesRegex(RuntimeError, 'already stopped'):
+            timer.stop()
+
+    def test_reset_global_timer(self):
+        orig = timing._globalTimer
+        try:
+            out = StringIO()
+            timer = reset_global_timer(TicTocTimer(ostream=out))
+            self.assertIs(timing._globalTimer, timer)
+            toc('replaced')
+            self.assertRegex(out.getvalue(), r'^\[\+ *[0-9.]+\] replaced\n$')
+            new_timer = reset_global_timer()
+            self.assertIsNot(new_timer, timer)
+            self.assertIs(timing._get_thread_timer(), new_timer)
+        finally:
+            reset_global_timer(orig)
+        self.assertIs(timing._globalTimer, orig)
+
+    @unittest.skipIf(not hasattr(time, 'CLOCK_MONOTONIC_RAW'),
+                     'CLOCK_MONOTONIC_RAW is not available')
+    def test_monotonic_raw_clock(self):
+        script = '\n'.join([
+            "import time",
+            "from six import StringIO",
+            "import pyutilib.misc.timing as timing",
+            "assert timing._time_source.args == (time.CLOCK_MONOTONIC_RAW,)",
+            "assert timing._time_source_ns is not "
+            "    getattr(time, 'perf_counter_ns', None)",
+            "assert not hasattr(time, 'clock_gettime_ns') or "
+            "    timing._time_source_ns.args == (time.CLOCK_MONOTONIC_RAW,)",
+            "assert timing._time_source_ns() > 0",
+            "timer = timing.TicTocTimer(ostream=StringIO())",
+            "time.sleep(0.01)",
+            "assert timer.toc('') >= 0.01",
+            "htimer = timing.HierarchicalTimer()",
+            "htimer.start('a')",
+            "time.sleep(0.01)",
+            "htimer.stop('a')",
+            "assert htimer.get_total_time('a') >= 0.01",
+            "print('ok')",
+        ])
+        env = dict(os.environ)
+        env['PYUTILIB_TIMER_MONOTONIC_RAW'] = '1'
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [root] + [p for p in [env.get('PYTHONPATH')] if p])
+        output = subprocess.check_output(
+            [sys.executable, '-c', script], env=env)
+        self.assertEqual(output.decode().strip(), 'ok')
+
+    def test_pickle_and_deepcopy(self):
+        timer = TicTocTimer()
+        timer.start()
+        timer.stop()
+        copies = [pickle.loads(pickle.dumps(timer, protocol))
+                  for protocol in range(pickle.HIGHEST_PROTOCOL + 1)]
+        copies.append(copy.deepcopy(timer))
+        for other in copies:
+            self.assertIsNot(other, timer)
+            self.assertEqual(other._cumul, timer._cumul)
+            self.assertEqual(other._loadTime, timer._loadTime)
+            self.assertEqual(other.toc(''), timer.toc(''))
@@ -8,11 +8,17 @@
 #  _________________________________________________________________________
 #
 
+from __future__ import division
+
+import functools
+import logging
+import os
 import sys
+import threading
 import time
 import traceback
 
-__all__ = ('TicTocTimer', 'tic', 'toc')
+__all__ = ('TicTocTimer', 'tic', 'toc', 'reset_global_timer')
 
 #
 # Setup the timer
@@ -31,6 +37,52 @@ else:
     else:
         _time_source = time.time
 
+if hasattr(time, 'perf_counter_ns'):
+    # Integer nanoseconds: accumulating ints avoids float rounding and
+    # the float conversions until the results are reported.
+    _time_source_ns = time.perf_counter_ns
+else:
+    def _time_source_ns():
+        return int(_time_source() * 1e9)
+
+# Optionally read the raw hardware clock through clock_gettime().
+# Unlike perf_counter, CLOCK_MONOTONIC_RAW is not subject to NTP
+# slewing.
+if os.environ.get('PYUTILIB_TIMER_MONOTONIC_RAW', '') == '1' \
+   and hasattr(time, 'CLOCK_MONOTONIC_RAW'):
+    _time_source = functools.partial(
+        time.clock_gettime, time.CLOCK_MONOTONIC_RAW)
+    if hasattr(time, 'clock_gettime_ns'):
+        _time_source_ns = functools.partial(
+            time.clock_gettime_ns, time.CLOCK_MONOTONIC_RAW)
+    else:
+        def _time_source_ns():
+            return int(_time_source() * 1e9)
+
+#
+# Setup the caller lookup used to build the default toc() message.
+# sys._getframe() is a CPython implementation detail; fall back on the
+# (much slower) traceback module on implementations that do not
+# provide it.
+#
+# Frames from this module (TicTocTimer.toc() and the module-level
+# toc() wrapper) are skipped so that the message reports the user's
+# code.
+#
+if hasattr(sys, '_getframe'):
+    def _caller_info():
+        f = sys._getframe(1)
+        while f.f_globals is _module_globals:
+            f = f.f_back
+        return f.f_code.co_filename, f.f_lineno, f.f_code.co_name
+else:
+    def _caller_info():
+        for frame in reversed(traceback.extract_stack()):
+            if frame[0] != _srcfile:
+                return tuple(frame[:3])
+_module_globals = globals()
+_srcfile = _caller_info.__code__.co_filename
+
 class TicTocTimer(object):
     """A class to calculate and report elapsed time.
 
@@ -48,13 +100,41 @@ class TicTocTimer(object):
             information
         logger (Logger): an optional output stream using the python
            logging package. Note: timing logged using logger.info
+        buffer_size (int): the number of messages to collect before
+           writing them to the output stream.  The default (1) writes
+           every message immediately; larger values coalesce the writes
+           from tight loops.  Buffered messages are written by
+           :meth:`flush`.
     """
-    def __init__(self, ostream=None, logger=None):
+    __slots__ = ('_lastTime', '_loadTime', '_ostream', '_logger',
+                 '_start_count', '_cumul', '_buffer', '_buffer_size',
+                 '_buffer_stream', '__weakref__')
+
+    def __init__(self, ostream=None, logger=None, buffer_size=1):
         self._lastTime = self._loadTime = _time_source()
         self._ostream = ostream
         self._logger = logger
         self._start_count = 0
         self._cumul = 0
+        self._buffer = []
+        self._buffer_size = buffer_size
+        self._buffer_stream = None
+
+    # Note: classes with __slots__ need explicit state methods to be
+    # pickled with protocols 0 and 1
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if name != '__weakref__')
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __del__(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
 
     def tic(self, msg=None, ostream=None, logger=None):
         """Reset the tic/toc delta timer.
@@ -91,7 +171,8 @@ class TicTocTimer(object):
                 (default), then print out the file name, line number,
                 and function that called this method; if it evaluates to
                 :const:`False` (:const:`0`, :const:`False`, :const:`""`)
-                then no message is printed.
+                then no message is generated or printed and only the
+                elapsed time is returned.
             delta (bool): print out the elapsed wall clock time since
                 the last call to :meth:`tic` or :meth:`toc`
                 (:const:`True` (default)) or since the module was first
@@ -101,41 +182,65 @@ class TicTocTimer(object):
             logger (Logger): an optional output stream using the python
                 logging package (overrides the ostream provided when the
                 class was constructed). Note: timing logged using logger.info
-        """
 
-        if msg is None:
-            msg = 'File "%s", line %s in %s' % \
-                  traceback.extract_stack(limit=2)[0][:3]
+        Returns:
+            float: the elapsed time (in seconds)
+        """
 
+        # Read the clock first so that the cost of generating the
+        # message is not included in the reported time
         now = _time_source()
-        if self._start_count or self._lastTime is None:
+
+        lastTime = self._lastTime
+        if self._start_count or lastTime is None:
             ans = self._cumul
-            if self._lastTime:
-                ans += _time_source() - self._lastTime
-            if msg:
-                msg = "[%8.2f|%4d] %s\n" % (ans, self._start_count, msg)
+            if lastTime:
+                ans += now - lastTime
         elif delta:
-            ans = now - self._lastTime
+            ans = now - lastTime
             self._lastTime = now
-            if msg:
-                msg = "[+%7.2f] %s\n" % (ans, msg)
         else:
             ans = now - self._loadTime
-            if msg:
-                msg = "[%8.2f] %s\n" % (ans, msg)
 
-        if msg:
-            if ostream is None:
-                ostream = self._ostream
-                if ostream is None and logger is None:
-                    ostream = sys.stdout
-            if ostream is not None:
+        if not msg and msg is not None:
+            # Nothing to report (the timer is being used as a stopwatch)
+            return ans
+
+        if ostream is None:
+            ostream = self._ostream
+            if ostream is None and logger is None:
+                ostream = sys.stdout
+        if logger is None:
+            logger = self._logger
+        if logger is not None and not logger.isEnabledFor(logging.INFO):
+            logger = None
+        if ostream is None and logger is None:
+            # The message would be discarded: do not bother generating it
+            return ans
+
+        if msg is None:
+            msg = 'File "%s", line %s in %s' % _caller_info()
+        if self._start_count or lastTime is None:
+            msg = "[%8.2f|%4d] %s\n" % (ans, self._start_count, msg)
+        elif delta:
+            msg = "[+%7.2f] %s\n" % (ans, msg)
+        else:
+            msg = "[%8.2f] %s\n" % (ans, msg)
+
+        if ostream is not None:
+            if self._buffer_size > 1:
+                if ostream is not self._buffer_stream:
+                    self.flush()
+                    self._buffer_stream = ostream
+                buf = self._buffer
+                buf.append(msg)
+                if len(buf) >= self._buffer_size:
+                    self.flush()
+            else:
                 ostream.write(msg)
 
-            if logger is None:
-                logger = self._logger
-            if logger is not None:
-                logger.info(msg)
+        if logger is not None:
+            logger.info(msg)
 
         return ans
 
@@ -149,73 +254,195 @@ class TicTocTimer(object):
             raise
         self._cumul += delta
         self._lastTime = None
+        if self._buffer:
+            self.flush()
         return delta
 
     def start(self):
+        # Read the clock once: the same reading ends any running
+        # interval and starts the new one
+        now = _time_source()
         if self._lastTime:
-            self.stop()
+            self._cumul += now - self._lastTime
         self._start_count += 1
-        self._lastTime = _time_source()
+        self._lastTime = now
 
+    def flush(self):
+        """Write out any buffered messages."""
+        if self._buffer:
+            self._buffer_stream.write(''.join(self._buffer))
+            del self._buffer[:]
+
+#
+# The module-level tic() and toc() functions use a separate TicTocTimer
+# for each thread so that threads do not reset each other's reference
+# time.  The thread that imports this module uses _globalTimer.  All
+# timers share the module load time (the reference for toc(delta=False)).
+#
 _globalTimer = TicTocTimer()
-tic = _globalTimer.tic
-toc = _globalTimer.toc
+_load_time = _globalTimer._loadTime
+_thread_timers = threading.local()
+_thread_timers.timer = _globalTimer
+
+def _get_thread_timer():
+    try:
+        return _thread_timers.timer
+    except AttributeError:
+        timer = _thread_timers.timer = TicTocTimer()
+        timer._loadTime = _load_time
+        return timer
+
+def tic(msg=None, ostream=None, logger=None):
+    return _get_thread_timer().tic(msg, ostream, logger)
+tic.__doc__ = TicTocTimer.tic.__doc__
+
+def toc(msg=None, delta=True, ostream=None, logger=None):
+    return _get_thread_timer().toc(msg, delta, ostream, logger)
+toc.__doc__ = TicTocTimer.toc.__doc__
+
+def reset_global_timer(timer=None):
+    """Replace the TicTocTimer used by tic() and toc() in this thread.
+
+    The module-level tic() and toc() functions look up the current
+    thread's timer on every call, so the replacement takes effect
+    immediately, including for functions that were imported with
+    ``from pyutilib.misc.timing import tic, toc``.
+
+    Args:
+        timer (TicTocTimer): the new timer.  If :const:`None` (default),
+            a new TicTocTimer is created.
+
+    Returns:
+        TicTocTimer: the new timer
+    """
+    global _globalTimer
+    if timer is None:
+        timer = TicTocTimer()
+    old_timer = _get_thread_timer()
+    old_timer.flush()
+    if old_timer is _globalTimer:
+        _globalTimer = timer
+    _thread_timers.timer = timer
+    return timer
+
+
+class _HierarchicalThreadTimer(object):
+    # The calls and time recorded for one _HierarchicalHelper by a
+    # single thread.  Only that thread updates it, so no locking is
+    # needed.  total_time is stored as integer nanoseconds.
+    __slots__ = ('helper', 'timers', 'total_time', 'n_calls')
+
+    def __init__(self, helper, total_time=0, n_calls=0):
+        self.helper = helper
+        # This thread's records for the children of helper
+        self.timers = dict()
+        self.total_time = total_time
+        self.n_calls = n_calls
 
 
 class _HierarchicalHelper(object):
+    # Note: total_time is in integer nanoseconds and is only converted
+    # to seconds when it is reported.  The calls and times are recorded
+    # per thread (see _HierarchicalThreadTimer) and summed when they
+    # are read.
+    __slots__ = ('timers', '_thread_timers')
+
     def __init__(self):
-        self.tic_toc = TicTocTimer()
         self.timers = dict()
-        self.total_time = 0
-        self.n_calls = 0
+        self._thread_timers = list()
 
-    def start(self):
-        self.n_calls += 1
-        self.tic_toc.start()
+    @property
+    def total_time(self):
+        return sum(t.total_time for t in self._thread_timers)
 
-    def stop(self):
-        self.total_time += self.tic_toc.stop()
+    @property
+    def n_calls(self):
+        return sum(t.n_calls for t in self._thread_timers)
+
+    # Note: classes with __slots__ need explicit state methods to be
+    # pickled with protocols 0 and 1
+    def __getstate__(self):
+        return (self.timers, self.total_time, self.n_calls)
+
+    def __setstate__(self, state):
+        self.timers, total_time, n_calls = state
+        # The merged totals are not associated with any thread
+        self._thread_timers = [
+            _HierarchicalThreadTimer(self, total_time, n_calls)]
 
     def to_str(self, indent, stage_identifier_lengths):
-        s = ''
+        parts = []
+        self._to_str(parts, _get_report_formats(
+            stage_identifier_lengths, indent), 0)
+        return ''.join(parts)
+
+    def _to_str(self, parts, formats, depth):
+        # Append the rows for this timer's children to the parts list
+        # (using the precomputed layout for this depth)
         if len(self.timers) > 0:
-            underline = indent + '-' * (sum(stage_identifier_lengths) + 36) + '\n'
-            s += underline
-            name_formatter = '{name:<' + str(sum(stage_identifier_lengths)) + '}'
+            # Compute the scaling for the percent column once (NaN if
+            # this timer has not accumulated any time)
+            if self.total_time > 0:
+                percent_scale = 100 / self.total_time
+            else:
+                percent_scale = float('nan')
+            underline, row_format, other_format, overline = formats[depth]
+            parts.append(underline)
             other_time = self.total_time
-            sub_stage_identifier_lengths = stage_identifier_lengths[1:]
             for name, timer in self.timers.items():
-                if self.total_time > 0:
-                    _percent = timer.total_time / self.total_time * 100
-                else:
-                    _percent = float('nan')
-                s += indent
-                s += ( name_formatter + '{ncalls:>9d} {cumtime:>9.3f} '
-                       '{percall:>9.3f} {percent:>6.1f}\n' ).format(
-                           name=name,
-                           ncalls=timer.n_calls,
-                           cumtime=timer.total_time,
-                           percall=timer.total_time/timer.n_calls,
-                           percent=_percent )
-                s += timer.to_str(
-                    indent=indent + ' '*stage_identifier_lengths[0],
-                    stage_identifier_lengths=sub_stage_identifier_lengths)
+                parts.append(row_format(
+                    name=name,
+                    ncalls=timer.n_calls,
+                    cumtime=timer.total_time/1e9,
+                    percall=timer.total_time/1e9/timer.n_calls,
+                    percent=timer.total_time * percent_scale ))
+                timer._to_str(parts, formats, depth + 1)
                 other_time -= timer.total_time
 
-            if self.total_time > 0:
-                _percent = other_time / self.total_time * 100
-            else:
-                _percent = float('nan')
-            s += indent
-            s += ( name_formatter + '{ncalls:>9} {cumtime:>9.3f} '
-                   '{percall:>9} {percent:>6.1f}\n' ).format(
-                       name='other',
-                       ncalls='n/a',
-                       cumtime=other_time,
-                       percall='n/a',
-                       percent=_percent )
-            s += underline.replace('-', '=')
-        return s
+            parts.append(other_format(
+                name='other',
+                ncalls='n/a',
+                cumtime=other_time/1e9,
+                percall='n/a',
+                percent=other_time * percent_scale ))
+            parts.append(overline)
+
+
+def _get_report_formats(stage_identifier_lengths, indent=''):
+    """Build the report layout for each level of a HierarchicalTimer
+
+    Returns a list with one (underline, row formatter, 'other' row
+    formatter, closing line) tuple per level, so that the indentation
+    and format strings are built once per report rather than once per
+    timer.
+    """
+    formats = []
+    for depth, length in enumerate(stage_identifier_lengths):
+        name_length = sum(stage_identifier_lengths[depth:])
+        name_formatter = '{name:<' + str(name_length) + '}'
+        underline = indent + '-' * (name_length + 36) + '\n'
+        formats.append((
+            underline,
+            ( indent + name_formatter + '{ncalls:>9d} {cumtime:>9.3f} '
+              '{percall:>9.3f} {percent:>6.1f}\n' ).format,
+            ( indent + name_formatter + '{ncalls:>9} {cumtime:>9.3f} '
+              '{percall:>9} {percent:>6.1f}\n' ).format,
+            underline.replace('-', '='),
+        ))
+        indent += ' ' * length
+    return formats
+
+
+class _HierarchicalTimerStack(threading.local):
+    # The active timers for a HierarchicalTimer (one instance per thread)
+    def __init__(self):
+        # The identifiers of the active timers
+        self.stack = list()
+        # (_HierarchicalThreadTimer, start time) for each entry in
+        # self.stack
+        self.timers = list()
+        # This thread's records for the top-level timers
+        self.root = dict()
 
 
 class HierarchicalTimer(object):
@@ -300,12 +527,51 @@ class HierarchicalTimer(object):
 
     and so on. This way, we can easily access any timer with something
     that looks like the stack. The logic is recursive (although the
-    code is not).
+    code is not). The _HierarchicalHelper objects for the active timers
+    (and their start times) are also kept in a parallel stack so that
+    starting or stopping a timer does not have to walk the hierarchy
+    from the root, and every timer is recorded in a flat dictionary
+    keyed by its full path (e.g., ('all', 'a', 'aa')) so that looking up
+    a timer by name is a single dictionary access.
+
+    The stack of active timers is local to each thread, so threads may
+    start and stop timers independently.  Timers with the same path in
+    different threads share the same _HierarchicalHelper, but each
+    thread records its calls and time in its own mirror of the
+    hierarchy (_HierarchicalThreadTimer objects), which are summed when
+    the timer is reported.  Only creating a new _HierarchicalHelper
+    requires a lock.
 
     """
+    __slots__ = ('timers', '_timers_by_path', '_active', '_lock',
+                 '__weakref__')
+
     def __init__(self):
-        self.stack = list()
         self.timers = dict()
+        # Flat index of every timer keyed by its full path (a tuple of
+        # identifiers)
+        self._timers_by_path = dict()
+        # The (thread-local) stack of active timers
+        self._active = _HierarchicalTimerStack()
+        # Guards changes to the (shared) hierarchy of timers
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The thread-local stack of active timers cannot be pickled (and
+        # is meaningless in another thread / process): drop it
+        return {'timers': self.timers,
+                '_timers_by_path': self._timers_by_path}
+
+    def __setstate__(self, state):
+        self.timers = state['timers']
+        self._timers_by_path = state['_timers_by_path']
+        self._active = _HierarchicalTimerStack()
+        self._lock = threading.Lock()
+
+    @property
+    def stack(self):
+        """The identifiers of the timers active in the current thread"""
+        return self._active.stack
 
     def _get_timer(self, identifier, should_exist=False):
         """
@@ -327,16 +593,27 @@ class HierarchicalTimer(object):
         timer: _HierarchicalHelper
 
         """
-        parent = self._get_timer_from_stack(self.stack)
-        if identifier in parent.timers:
-            return parent.timers[identifier]
+        active = self._active
+        if active.timers:
+            parent = active.timers[-1][0].helper
         else:
+            parent = self
+        # Note: a single dictionary probe on the (common) hit path
+        timer = parent.timers.get(identifier, None)
+        if timer is None:
             if should_exist:
                 raise RuntimeError(
                     'Could not find timer {0}'.format(
-                        '.'.join(self.stack + [identifier])))
-            parent.timers[identifier] = _HierarchicalHelper()
-            return parent.timers[identifier]
+                        '.'.join(active.stack + [identifier])))
+            with self._lock:
+                # Another thread may have created the timer since the
+                # (unlocked) lookup above
+                timer = parent.timers.get(identifier, None)
+                if timer is None:
+                    timer = parent.timers[identifier] = _HierarchicalHelper()
+                    self._timers_by_path[
+                        tuple(active.stack) + (identifier,)] = timer
+        return timer
 
     def start(self, identifier):
         """
@@ -347,9 +624,24 @@ class HierarchicalTimer(object):
         identifier: str
             The name of the timer
         """
-        timer = self._get_timer(identifier)
-        timer.start()
-        self.stack.append(identifier)
+        active = self._active
+        timers = active.timers
+        if timers:
+            siblings = timers[-1][0].timers
+        else:
+            siblings = active.root
+        timer = siblings.get(identifier, None)
+        if timer is None:
+            # First time this thread starts this timer: find (or create)
+            # the shared _HierarchicalHelper and attach a record for
+            # this thread to it
+            helper = self._get_timer(identifier)
+            timer = siblings[identifier] = _HierarchicalThreadTimer(helper)
+            with self._lock:
+                helper._thread_timers.append(timer)
+        timer.n_calls += 1
+        active.stack.append(identifier)
+        timers.append((timer, _time_source_ns()))
 
     def stop(self, identifier):
         """
@@ -360,14 +652,21 @@ class HierarchicalTimer(object):
         identifier: str
             The name of the timer
         """
-        if identifier != self.stack[-1]:
+        now = _time_source_ns()
+        active = self._active
+        stack = active.stack
+        if not stack:
+            raise ValueError(
+                str(identifier) + ' is not the currently active timer.  '
+                'There are no active timers')
+        if identifier != stack[-1]:
             raise ValueError(
                 str(identifier) + ' is not the currently active timer.  '
                 'The only timer that can currently be stopped is '
-                + '.'.join(self.stack))
-        self.stack.pop()
-        timer = self._get_timer(identifier, should_exist=True)
-        timer.stop()
+                + '.'.join(stack))
+        stack.pop()
+        timer, t0 = active.timers.pop()
+        timer.total_time += now - t0
 
     def _get_identifier_len(self):
         stage_timers = list(self.timers.items())
@@ -387,37 +686,42 @@ class HierarchicalTimer(object):
 
     def __str__(self):
         stage_identifier_lengths = self._get_identifier_len()
+        # Note: there are no stages if no timers have been started (the
+        # single empty stage reproduces the empty table)
+        formats = _get_report_formats(stage_identifier_lengths or [0])
         name_formatter = '{name:<' + str(sum(stage_identifier_lengths)) + '}'
-        s = ( name_formatter + '{ncalls:>9} {cumtime:>9} '
-              '{percall:>9} {percent:>6}\n').format(
-                  name='Identifier',
-                  ncalls='ncalls',
-                  cumtime='cumtime',
-                  percall='percall',
-                  percent='%')
-        underline = '-' * (sum(stage_identifier_lengths) + 36) + '\n'
-        s += underline
-        sub_stage_identifier_lengths = stage_identifier_lengths[1:]
+        parts = [( name_formatter + '{ncalls:>9} {cumtime:>9} '
+                   '{percall:>9} {percent:>6}\n').format(
+                       name='Identifier',
+                       ncalls='ncalls',
+                       cumtime='cumtime',
+                       percall='percall',
+                       percent='%')]
+        underline, row_format, other_format, overline = formats[0]
+        parts.append(underline)
+        total_time = sum(timer.total_time for timer in self.timers.values())
+        if total_time > 0:
+            percent_scale = 100 / total_time
+        else:
+            percent_scale = float('nan')
         for name, timer in self.timers.items():
-            s += ( name_formatter + '{ncalls:>9d} {cumtime:>9.3f} '
-                   '{percall:>9.3f} {percent:>6.1f}\n').format(
-                       name=name,
-                       ncalls=timer.n_calls,
-                       cumtime=timer.total_time,
-                       percall=timer.total_time/timer.n_calls,
-                       percent=self.get_total_percent_time(name))
-            s += timer.to_str(
-                indent=' '*stage_identifier_lengths[0],
-                stage_identifier_lengths=sub_stage_identifier_lengths)
-        s += underline.replace('-', '=')
-        return s
+            parts.append(row_format(
+                name=name,
+                ncalls=timer.n_calls,
+                cumtime=timer.total_time/1e9,
+                percall=timer.total_time/1e9/timer.n_calls,
+                percent=timer.total_time * percent_scale))
+            timer._to_str(parts, formats, 1)
+        parts.append(overline)
+        return ''.join(parts)
 
     def reset(self):
         """
         Completely reset the timer.
         """
-        self.stack = list()
         self.timers = dict()
+        self._timers_by_path = dict()
+        self._active = _HierarchicalTimerStack()
 
     def _get_timer_from_stack(self, stack):
         """
@@ -432,10 +736,9 @@ class HierarchicalTimer(object):
         -------
         timer: _HierarchicalHelper
         """
-        tmp = self
-        for i in stack:
-            tmp = tmp.timers[i]
-        return tmp
+        if not stack:
+            return self
+        return self._timers_by_path[tuple(stack)]
 
     def get_total_time(self, identifier):
         """
@@ -452,7 +755,7 @@ class HierarchicalTimer(object):
         """
         stack = identifier.split('.')
         timer = self._get_timer_from_stack(stack)
-        return timer.total_time
+        return timer.total_time / 1e9
 
     def get_num_calls(self, identifier):
         """